@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import sys
+import subprocess
+import statistics
+
+if len(sys.argv) not in [3, 4] or len(sys.argv[1]) != 2:
+    print(f"Usage: {sys.argv[0]} 2_LETTER_COUNTRY_CODE WORD [RUNS]")
+    sys.exit(1)
+lang = sys.argv[1]
+compound = sys.argv[2]
+runs = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+db_path = "compound_dbs"
+
+# Each measurement runs in a fresh interpreter, so that it sees the same cold
+# start as a short-lived CLI invocation.
+first_split_code = f"""
+import time
+start = time.perf_counter()
+import wikdict_compound
+imported = time.perf_counter()
+wikdict_compound.split_compound({db_path!r}, {lang!r}, {compound!r})
+done = time.perf_counter()
+print(imported - start, done - imported)
+"""
+
+
+def import_time() -> float:
+    """Cumulative import time of wikdict_compound in ms, as reported by Python"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import wikdict_compound"],
+        capture_output=True,
+        encoding="utf-8",
+        check=True,
+    ).stderr
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _self, cumulative, package = line.split("|")
+        if package.strip() == "wikdict_compound":
+            return int(cumulative) / 1000
+    raise Exception("wikdict_compound import not found in importtime output")
+
+
+def first_split() -> tuple[float, float]:
+    """Wall clock time in ms for the import and the first split afterwards"""
+    output = subprocess.check_output(
+        [sys.executable, "-c", first_split_code], encoding="utf-8"
+    )
+    import_seconds, split_seconds = output.split()
+    return float(import_seconds) * 1000, float(split_seconds) * 1000
+
+
+import_times = [import_time() for _ in range(runs)]
+first_splits = [first_split() for _ in range(runs)]
+loaded_modules = subprocess.check_output(
+    [
+        sys.executable,
+        "-c",
+        "import sys, wikdict_compound; print(' '.join(sorted(sys.modules)))",
+    ],
+    encoding="utf-8",
+).split()
+
+print(f"Median over {runs} runs:")
+print(f"\t importtime: {statistics.median(import_times):.1f} ms")
+print(f"\t import: {statistics.median(t[0] for t in first_splits):.1f} ms")
+print(f"\t first split: {statistics.median(t[1] for t in first_splits):.1f} ms")
+print(f"\t make_db imported: {'wikdict_compound.build' in loaded_modules}")
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+import sys
+from wikdict_compound.profiling import slowest_words
+
+if len(sys.argv) not in [3, 4] or len(sys.argv[1]) != 2:
+    print(f"Usage: {sys.argv[0]} 2_LETTER_COUNTRY_CODE WORD_FILE [COUNT]")
+    sys.exit(1)
+lang = sys.argv[1]
+word_file = sys.argv[2]
+count = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+db_path = "compound_dbs"
+
+with open(word_file) as f:
+    words = (word for line in f for word in line.split())
+    timings = slowest_words(db_path, lang, words, count)
+
+for t in timings:
+    print(f"{t.seconds * 1000:8.1f} ms\t{t.search_queries:4} search queries\t{t.compound}")
@@ -22,6 +22,7 @@ results = split_compound(
     ignore_word=compound,
     all_results=True,
     write_graph_to_file="graph.dot",
+    write_profile_to_file="profile.json",
 )
 print()
 for r in results:
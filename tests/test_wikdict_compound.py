@@ -1,6 +1,336 @@
-from wikdict_compound import split_compound
+import json
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import wikdict_compound
+from wikdict_compound import batch, make_db, profiling, split_compound
 
 
 def test_dummy_test():
     # We don't have the dictionary data in the repo to run proper tests, yet
     assert True
+
+
+def make_wikdict_db(path, lang, entries, forms=()):
+    """Create a tiny stand-in for a WikDict dictionary db.
+
+    `entries` are (written_rep, part_of_speech, rel_score) tuples, `forms` are
+    (written_rep, other_written) tuples for inflected forms.
+    """
+    conn = sqlite3.connect(path / f"{lang}.sqlite3")
+    conn.executescript(
+        """
+        CREATE TABLE entry (lexentry, written_rep, part_of_speech);
+        CREATE TABLE form (lexentry, other_written, tense, pos, mood, voice);
+        CREATE TABLE rel_importance (written_rep_guess, rel_score);
+    """
+    )
+    for lexentry, (written_rep, part_of_speech, rel_score) in enumerate(entries):
+        conn.execute(
+            "INSERT INTO entry VALUES (?, ?, ?)",
+            (lexentry, written_rep, part_of_speech),
+        )
+        conn.execute(
+            "INSERT INTO rel_importance VALUES (?, ?)", (written_rep, rel_score)
+        )
+    for written_rep, other_written in forms:
+        conn.execute(
+            """
+            INSERT INTO form (lexentry, other_written)
+            SELECT lexentry, ? FROM entry WHERE written_rep = ?
+        """,
+            (other_written, written_rep),
+        )
+    conn.commit()
+    conn.close()
+
+
+def make_compound_db(tmp_path_factory, lang, entries, forms=()):
+    input_path = tmp_path_factory.mktemp("wikdict")
+    output_path = tmp_path_factory.mktemp("compound_dbs")
+    make_wikdict_db(input_path, lang, entries, forms)
+    make_db(lang, input_path, output_path)
+    return output_path
+
+
+@pytest.fixture(scope="module")
+def de_db_path(tmp_path_factory):
+    return make_compound_db(
+        tmp_path_factory,
+        "de",
+        entries=[
+            ("Buch", "noun", 10),
+            ("Kiste", "noun", 5),
+            ("Zeitung", "noun", 5),
+            ("Zeit", "noun", 8),
+            ("Artikel", "noun", 5),
+            ("un-", "prefix", 5),
+            ("-ung", "suffix", 5),
+        ],
+        forms=[("Buch", "Bücher")],
+    )
+
+
+@pytest.mark.parametrize(
+    "compound, parts",
+    [
+        ("Bücherkiste", ["Buch", "Kiste"]),
+        ("Zeitungsartikel", ["Zeitung", "Artikel"]),
+        ("Unzeit", ["un-", "Zeit"]),
+    ],
+)
+def test_split_compound(de_db_path, compound, parts):
+    solution = split_compound(de_db_path, "de", compound)
+    assert [p.written_rep for p in solution.parts] == parts
+
+
+def test_unsplittable(de_db_path):
+    assert split_compound(de_db_path, "de", "Kistenbuchx") is None
+
+
+def test_unsplittable_without_search(de_db_path):
+    # No entry matches the end of the word, so no search is needed
+    query_count = wikdict_compound.query_count
+    assert split_compound(de_db_path, "de", "Buchkistex") is None
+    assert wikdict_compound.query_count == query_count + 1
+
+
+def test_import_does_not_load_make_db():
+    # Keeps the startup fast for users who only want to split words
+    code = (
+        "import sys, wikdict_compound; "
+        "print('wikdict_compound.build' in sys.modules)"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], encoding="utf-8")
+    assert output.strip() == "False"
+    assert callable(wikdict_compound.make_db)
+
+
+def test_make_db_after_submodule_import():
+    # Importing the submodule first must not shadow the make_db function
+    code = (
+        "import wikdict_compound.build; "
+        "from wikdict_compound import make_db; "
+        "print(callable(make_db))"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], encoding="utf-8")
+    assert output.strip() == "True"
+
+
+@pytest.mark.parametrize(
+    "lang, entries, compound, parts",
+    [
+        (
+            "sv",
+            [("Älg", "noun", 5), ("kött", "noun", 5)],
+            "Älgkött",
+            ["Älg", "kött"],
+        ),
+        (
+            "fi",
+            [("Öljy", "noun", 5), ("lamppu", "noun", 5)],
+            "ÖLJYLAMPPU",
+            ["Öljy", "lamppu"],
+        ),
+        (
+            "pl",
+            [("Światło", "noun", 5), ("wód", "noun", 5)],
+            "Światłowód",
+            ["Światło", "wód"],
+        ),
+        # decomposed input (NFD)
+        (
+            "sv",
+            [("Älg", "noun", 5), ("kött", "noun", 5)],
+            "A\u0308lgko\u0308tt",
+            ["Älg", "kött"],
+        ),
+    ],
+)
+def test_non_ascii_case(tmp_path_factory, lang, entries, compound, parts):
+    db_path = make_compound_db(tmp_path_factory, lang, entries)
+    solution = split_compound(db_path, lang, compound)
+    assert [p.written_rep for p in solution.parts] == parts
+
+
+@pytest.mark.parametrize("mode", batch.SHARD_MODES)
+def test_batch(de_db_path, tmp_path, mode):
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_text(
+        "Bücherkiste Zeitungsartikel\nUnzeit Kistenbuchx\n" * 3 + "BÜCHERKISTE\n"
+    )
+    batch.run(
+        de_db_path,
+        "de",
+        input_path,
+        tmp_path / "shards",
+        tmp_path / "merged.tsv",
+        num_shards=3,
+        mode=mode,
+    )
+    lines = (tmp_path / "merged.tsv").read_text().splitlines()
+    assert sorted(lines) == [
+        "bücherkiste\tBuch\tKiste",
+        "kistenbuchx",
+        "unzeit\tun-\tZeit",
+        "zeitungsartikel\tZeitung\tArtikel",
+    ]
+
+
+def test_batch_resume(de_db_path, tmp_path):
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_text("Bücherkiste\nUnzeit\n")
+    partial_path = batch.shard_path(tmp_path, 0, 1).with_suffix(".tsv.partial")
+    # Simulate an interrupted run with an incomplete last line
+    partial_path.write_text("bücherkiste\tFoo\tBar\nunz")
+
+    path = batch.split_shard(de_db_path, "de", input_path, tmp_path, 0, 1)
+    assert path.read_text() == "bücherkiste\tFoo\tBar\nunzeit\tun-\tZeit\n"
+    assert not partial_path.exists()
+
+
+def test_profile(de_db_path, tmp_path):
+    profile_path = tmp_path / "profile.json"
+    split_compound(
+        de_db_path, "de", "Buchkistebuchkiste", write_profile_to_file=profile_path
+    )
+    events = json.loads(profile_path.read_text())["traceEvents"]
+    categories = {e["cat"] for e in events}
+    assert categories == {"word", "node", "sql", "prune"}
+    query = next(e for e in events if e["cat"] == "sql")
+    assert query["ph"] == "X" and query["dur"] >= 0
+    assert query["args"]["plan"]
+
+
+def test_slowest_words(de_db_path):
+    words = ["Bücherkiste", "Unzeit", "Bücherkiste", "Kistenbuchx"]
+    timings = profiling.slowest_words(de_db_path, "de", words, count=2)
+    assert len(timings) == 2
+    assert timings[0].seconds >= timings[1].seconds
+    assert {t.compound for t in timings} <= set(words)
+
+
+def test_long_word(de_db_path):
+    # Only endings up to the longest entry's length are probed, so very long
+    # tokens neither take long nor exceed sqlite's variable limit
+    assert split_compound(de_db_path, "de", "x" * 20000 + "kiste") is None
+
+
+def test_sharp_s_is_kept(tmp_path_factory):
+    # "ß" must not be folded to "ss", which would merge Maß with Masse
+    db_path = make_compound_db(
+        tmp_path_factory,
+        "de",
+        entries=[("Maß", "noun", 5), ("Masse", "noun", 10), ("Band", "noun", 5)],
+    )
+    solution = split_compound(db_path, "de", "Maßband")
+    assert [p.written_rep for p in solution.parts] == ["Maß", "Band"]
+    assert [p.match for p in solution.parts] == ["maß", "band"]
+
+
+@pytest.mark.parametrize("ignore_word", ["ÄLGKÖTT", "A\u0308lgko\u0308tt"])
+def test_ignore_non_ascii_word(tmp_path_factory, ignore_word):
+    # The inflected form is only ignored via its written_rep
+    db_path = make_compound_db(
+        tmp_path_factory,
+        "sv",
+        entries=[("Älgkött", "noun", 5), ("Älg", "noun", 5), ("kött", "noun", 5)],
+        forms=[("Älgkött", "Älgköttet"), ("kött", "köttet")],
+    )
+    solution = split_compound(db_path, "sv", "Älgköttet", ignore_word=ignore_word)
+    assert [p.written_rep for p in solution.parts] == ["Älg", "kött"]
+
+
+def test_batch_word_error(de_db_path, tmp_path, monkeypatch):
+    def split_compound_in_db(conn, lang, compound):
+        if compound == "unzeit":
+            raise sqlite3.OperationalError("too many SQL variables")
+        return wikdict_compound.split_compound_in_db(conn, lang, compound)
+
+    monkeypatch.setattr(batch, "split_compound_in_db", split_compound_in_db)
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_text("Unzeit\nBücherkiste\n")
+    path = batch.split_shard(de_db_path, "de", input_path, tmp_path, 0, 1)
+    assert path.read_text() == "unzeit\nbücherkiste\tBuch\tKiste\n"
+    errors = path.with_suffix(".errors.tsv").read_text()
+    assert errors.startswith("unzeit\tOperationalError(")
+
+
+def test_batch_settings_mismatch(de_db_path, tmp_path):
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_text("Unzeit\n")
+    batch.split_shard(de_db_path, "de", input_path, tmp_path, 0, 1, mode="bytes")
+    with pytest.raises(ValueError):
+        batch.split_shard(de_db_path, "de", input_path, tmp_path, 0, 1, mode="hash")
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        "DROP TABLE stats",
+        "ALTER TABLE compound_splitter DROP COLUMN normalized_written_rep",
+    ],
+)
+def test_outdated_db(de_db_path, tmp_path, change):
+    outdated = sqlite3.connect(tmp_path / "de-compound.sqlite3")
+    sqlite3.connect(de_db_path / "de-compound.sqlite3").backup(outdated)
+    outdated.execute(change)
+    outdated.close()
+    with pytest.raises(ValueError, match="rebuild it with make_db"):
+        split_compound(tmp_path, "de", "Bücherkiste")
+
+
+def test_split_many(de_db_path, monkeypatch):
+    connections = []
+
+    def connect(db_path, lang):
+        conn = original_connect(db_path, lang)
+        connections.append(conn)
+        return conn
+
+    original_connect = wikdict_compound.connect
+    monkeypatch.setattr(wikdict_compound, "connect", connect)
+
+    results = wikdict_compound.split_many(
+        de_db_path, "de", ["Bücherkiste", "Kistenbuchx", "Unzeit"]
+    )
+    assert [
+        (compound, solution and [p.written_rep for p in solution.parts])
+        for compound, solution in results
+    ] == [
+        ("Bücherkiste", ["Buch", "Kiste"]),
+        ("Kistenbuchx", None),
+        ("Unzeit", ["un-", "Zeit"]),
+    ]
+
+    # The single connection is closed when done or when stopping early
+    results = wikdict_compound.split_many(de_db_path, "de", ["Bücherkiste"] * 3)
+    next(results)
+    results.close()
+    assert len(connections) == 2
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+
+def test_batch_invalid_arguments(de_db_path, tmp_path):
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_text("Unzeit\n")
+    output_dir = tmp_path / "shards"
+    with pytest.raises(ValueError):
+        batch.split_shard(de_db_path, "de", input_path, output_dir, 5, 3)
+    with pytest.raises(FileNotFoundError):
+        batch.split_shard(de_db_path, "de", tmp_path / "missing.txt", output_dir, 0, 3)
+    assert not output_dir.exists()
+
+
+def test_batch_merge_hash_mode_keeps_lines(tmp_path):
+    # Hash shards can't share words, so merge just concatenates them
+    (tmp_path / "settings.json").write_text(json.dumps(dict(mode="hash", num_shards=2)))
+    batch.shard_path(tmp_path, 0, 2).write_text("unzeit\tun-\tZeit\n")
+    batch.shard_path(tmp_path, 1, 2).write_text("unzeit\n")
+    batch.merge(tmp_path, tmp_path / "merged.tsv", 2)
+    assert (tmp_path / "merged.tsv").read_text() == "unzeit\tun-\tZeit\nunzeit\n"
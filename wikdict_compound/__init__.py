@@ -1,11 +1,12 @@
+import os
 import sqlite3
-from pathlib import Path
-import statistics
+import unicodedata
 from dataclasses import dataclass, replace
-from typing import Optional, Iterable
+from typing import Optional, Iterable, Iterator, TYPE_CHECKING
 from functools import cached_property
 
-from .make_db import make_db
+if TYPE_CHECKING:
+    from .profiling import Profile
 
 # for external users wanting to know which languages work mostly well
 supported_langs = "de en fi nl sv".split()
@@ -15,44 +16,88 @@ query_count = 0
 DEBUG_QUERY_LOG = False
 
 
-def find_matches_in_db(conn, compound: str, ignore_word=None, first_part=True):
-    global query_count
-    query = """
-        SELECT *
-        FROM (
-            SELECT DISTINCT
-                other_written,
-                length(other_written)*length(other_written) * rel_score AS rel_score,
-                affix_type,
-                written_rep,
-                part_of_speech_list
-            FROM compound_splitter
-            WHERE (
-                (
-                    other_written <= :compound
-                    AND other_written >= substr(:compound, 1, 4)
-                    AND :compound LIKE other_written || '%'
-                )
-                OR other_written = substr(:compound, 1, 1)
-                OR other_written = substr(:compound, 1, 2)
-                OR other_written = substr(:compound, 1, 3)
+def __getattr__(name):
+    # Building the dbs is not needed for splitting, so only import make_db
+    # when it is actually used to keep the startup fast.
+    if name == "make_db":
+        from .build import make_db
+
+        globals()["make_db"] = make_db
+        return make_db
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# For test data evaluation only. Without this, we could not split compound
+# words which are in the dictionary themselves. `:ignore_word` must be
+# normalized with `normalize_word`.
+NOT_IGNORED = """
+    other_written IS NOT :ignore_word
+    AND normalized_written_rep IS NOT :ignore_word
+"""
+
+
+def normalize_word(word: str) -> str:
+    """Lowercase and NFC normalize a word, as done for all dictionary entries
+
+    `str.casefold` is not used, since it would merge words like "Maß" and
+    "Masse" in German.
+    """
+    if word.isascii():
+        return word.lower()
+    return unicodedata.normalize("NFC", word.lower())
+
+
+def execute(conn, query: str, bindings: dict, profile=None):
+    if profile:
+        return profile.execute(conn, query, bindings)
+    return conn.execute(query, bindings)
+
+
+def build_match_query(first_part: bool) -> str:
+    # Prefixes can only be used as first part, suffixes and infixes only
+    # after that. No DISTINCT is needed, since compound_splitter is grouped by
+    # other_written and affix_type.
+    affix_types = "'prefix'" if first_part else "'suffix', 'infix'"
+    return f"""
+        SELECT
+            other_written,
+            length(other_written)*length(other_written) * rel_score AS rel_score,
+            affix_type,
+            written_rep,
+            part_of_speech_list
+        FROM compound_splitter
+        WHERE (
+            (
+                other_written <= :compound
+                AND other_written >= substr(:compound, 1, 4)
+                AND :compound LIKE other_written || '%'
             )
-            --WHERE other_written <= :compound AND :compound LIKE other_written || '%'
-            --WHERE other_written <= :compound AND other_written || 'z' > :compound
-              AND (affix_type IS NULL OR :first_part = (affix_type = "prefix"))
-
-              -- For test data evaluation only. Without this, we could not
-              -- split compound words which are in the dictionary themselves.
-              AND other_written IS NOT lower(:ignore_word)
-              AND lower(written_rep) IS NOT lower(:ignore_word)
+            OR other_written = substr(:compound, 1, 1)
+            OR other_written = substr(:compound, 1, 2)
+            OR other_written = substr(:compound, 1, 3)
         )
+          AND (affix_type IS NULL OR affix_type IN ({affix_types}))
+          AND {NOT_IGNORED}
         ORDER BY rel_score DESC
         LIMIT 3
     """
-    bindings = dict(compound=compound, ignore_word=ignore_word, first_part=first_part)
+
+
+# Built once, since the queries only differ by the allowed affix types
+MATCH_QUERIES = {
+    first_part: build_match_query(first_part) for first_part in [True, False]
+}
+
+
+def find_matches_in_db(
+    conn, compound: str, ignore_word=None, first_part=True, profile=None
+):
+    global query_count
+    query = MATCH_QUERIES[first_part]
+    bindings = dict(compound=compound, ignore_word=ignore_word)
     # if query_count == 0:
     #     print_query_plan(conn, query, bindings)
-    result = conn.execute(query, bindings)
+    result = execute(conn, query, bindings, profile)
 
     query_count += 1
     if DEBUG_QUERY_LOG:
@@ -65,6 +110,48 @@ def find_matches_in_db(conn, compound: str, ignore_word=None, first_part=True):
     return result
 
 
+def find_final_part_lengths_in_db(
+    conn: "CompoundDb", compound: str, lang: str, ignore_word=None, profile=None
+) -> set[int]:
+    """Return the lengths of all matches which can end the compound.
+
+    Only free morphemes and suffixes can be the last part and they must match
+    the end of the compound, so they are found by probing the index with all
+    endings of the compound. Matches can be extended by a linking letter (see
+    `get_potential_matches_for_row`), so the endings without the last letter
+    are probed, too.
+    """
+    global query_count
+    # Only endings up to the length of the longest entry can match
+    first = max(len(compound) - conn.max_length, 0)
+    endings = {compound[i:] for i in range(first, len(compound))} | {
+        compound[i:-1] for i in range(max(first - 1, 0), len(compound) - 1)
+    }
+    bindings = {f"ending{i}": ending for i, ending in enumerate(endings)}
+    query = f"""
+        SELECT DISTINCT other_written, affix_type, part_of_speech_list
+        FROM compound_splitter
+        WHERE other_written IN ({", ".join(":" + name for name in bindings)})
+          AND coalesce(affix_type, 'suffix') = 'suffix'
+          AND {NOT_IGNORED}
+    """
+    bindings["ignore_word"] = ignore_word
+    result = execute(conn, query, bindings, profile)
+    query_count += 1
+
+    lengths = set()
+    for r in result:
+        written = r["other_written"]
+        for start in [len(compound) - len(written) - i for i in [0, 1]]:
+            rest = compound[start:]
+            if start < 0 or not rest.startswith(written):
+                continue
+            for match in get_potential_matches_for_row(rest, r, lang):
+                if match == rest:
+                    lengths.add(len(match))
+    return lengths
+
+
 @dataclass(frozen=True)
 class Part:
     written_rep: str
@@ -79,6 +166,8 @@ class Solution:
 
     @cached_property
     def score(self):
+        import statistics  # only imported when needed to speed up startup
+
         return (
             statistics.geometric_mean(p.score for p in self.parts)
             / len(self.parts) ** 2
@@ -104,7 +193,9 @@ class SplitContext:
     lang: str
     compound: str
     queries: int = 0
+    min_final_part_len: int = 1  # parts leaving a shorter rest are dead ends
     graph_str: str = ""  # graphviz dot format visualization of splitting graph
+    profile: Optional["Profile"] = None  # only set when profiling
     best_partial_solution: Optional[PartialSolution] = None
     best_solution: Optional[Solution] = None
 
@@ -116,7 +207,7 @@ class SplitContext:
 def prune_branch(partial_solution, context) -> bool:
     """Is the current splitting branch unlikely to provide a good result?"""
     if context.queries > 100:
-        return True
+        return pruned("query limit", partial_solution, context)
 
     best_score = (
         context.best_partial_solution.score if context.best_partial_solution else 0
@@ -124,7 +215,7 @@ def prune_branch(partial_solution, context) -> bool:
     if partial_solution.score > best_score:
         context.best_partial_solution = partial_solution
     elif partial_solution.score < 0.1 * best_score:
-        return True
+        return pruned("low score", partial_solution, context, best_score=best_score)
 
     # if context.best_solution and len(solution.parts) == len(
     #     context.best_solution.parts
@@ -134,6 +225,17 @@ def prune_branch(partial_solution, context) -> bool:
     return False
 
 
+def pruned(reason: str, partial_solution, context, **args) -> bool:
+    if context.profile:
+        context.profile.prune(
+            reason,
+            parts=[p.match for p in partial_solution.parts],
+            score=partial_solution.score,
+            **args,
+        )
+    return True
+
+
 def get_potential_matches_for_row(compound, r, lang):
     match = r["other_written"].lower()
     yield match
@@ -149,7 +251,9 @@ def get_potential_next_parts(
     compound, ignore_word, first_part, context
 ) -> Iterable[Part]:
     context.queries += 1
-    result = find_matches_in_db(context.conn, compound, ignore_word, first_part)
+    result = find_matches_in_db(
+        context.conn, compound, ignore_word, first_part, context.profile
+    )
     if not result:
         return
 
@@ -165,6 +269,27 @@ def split_compound_interal(
     ignore_word=None,
     first_part=False,
     node_name="START",
+) -> list[Solution]:
+    if not context.profile:
+        return split_compound_node(
+            compound, context, partial_solution, ignore_word, first_part, node_name
+        )
+
+    with context.profile.span(node_name, "node", compound=compound) as args:
+        solutions = split_compound_node(
+            compound, context, partial_solution, ignore_word, first_part, node_name
+        )
+        args["solutions"] = len(solutions)
+    return solutions
+
+
+def split_compound_node(
+    compound: str,
+    context: SplitContext,
+    partial_solution: PartialSolution,
+    ignore_word,
+    first_part,
+    node_name,
 ) -> list[Solution]:
     if prune_branch(partial_solution, context):
         return []
@@ -173,16 +298,20 @@ def split_compound_interal(
     for new_part in get_potential_next_parts(
         compound, ignore_word, first_part, context
     ):
+        # The rest must still fit the last part, otherwise this is a dead end
+        rest = compound.replace(new_part.match, "", 1)
         new_partial_solution = replace(
             partial_solution, parts=partial_solution.parts + [new_part]
         )
+        if rest and len(rest) < context.min_final_part_len:
+            pruned("dead end", new_partial_solution, context, rest=rest)
+            continue
 
         new_node_name = f"{context.queries}-{new_part.written_rep}-{new_part.match}"
         context.graph_str += f'\t"{node_name}" -> "{new_node_name}"\n'
         context.graph_str += f'\t"{new_node_name}" [label="{new_part.written_rep}\\n{new_part.match}\\n{new_part.score:.2f}\\n{new_partial_solution.score:.2f}"]\n'
 
         # Did find the last part and have a complete solution?
-        rest = compound.replace(new_part.match, "", 1)
         if not rest:
             if new_part.affix_type in [None, "suffix"]:
                 solutions.append(Solution(parts=[new_part]))
@@ -212,23 +341,60 @@ def split_compound_interal(
     return solutions
 
 
-def split_compound(
-    db_path,
-    lang: str,
-    compound: str,
-    ignore_word=None,
-    all_results=False,
-    write_graph_to_file: Optional[str] = None,
-):
-    compound = compound.lower()
-    filename = str(Path(db_path) / f"{lang}-compound.sqlite3")
+# Tables and columns which are missing in dbs built by older versions of
+# make_db
+REQUIRED_SCHEMA = [
+    ("stats", "max_length"),
+    ("compound_splitter", "normalized_written_rep"),
+]
+
+
+class CompoundDb(sqlite3.Connection):
+    """Connection to a compound splitting db created by `make_db`"""
+
+    @cached_property
+    def max_length(self) -> int:
+        """Length of the longest entry"""
+        return self.execute("SELECT max_length FROM stats").fetchone()[0]
+
+
+def connect(db_path, lang: str) -> CompoundDb:
+    filename = os.path.join(db_path, f"{lang}-compound.sqlite3")
     try:
-        conn = sqlite3.connect(f"file:{filename}?mode=ro", uri=True)
+        conn = sqlite3.connect(
+            f"file:{filename}?mode=ro", uri=True, factory=CompoundDb
+        )
     except sqlite3.OperationalError:
         raise FileNotFoundError(filename)
 
     conn.row_factory = sqlite3.Row
-    context = SplitContext(conn=conn, lang=lang, compound=compound)
+    for table, column in REQUIRED_SCHEMA:
+        if not conn.execute(
+            "SELECT 1 FROM pragma_table_info(?) WHERE name = ?", (table, column)
+        ).fetchone():
+            conn.close()
+            raise ValueError(
+                f"{filename} was built by an older make_db (missing "
+                f"{table}.{column}), rebuild it with make_db"
+            )
+    return conn
+
+
+def split_compound_in_db(
+    conn: CompoundDb, lang: str, compound: str, ignore_word=None, profile=None
+) -> tuple[list[Solution], SplitContext]:
+    compound = normalize_word(compound)
+    if ignore_word:
+        ignore_word = normalize_word(ignore_word)
+    context = SplitContext(conn=conn, lang=lang, compound=compound, profile=profile)
+    final_part_lengths = find_final_part_lengths_in_db(
+        conn, compound, lang, ignore_word, profile
+    )
+    if not final_part_lengths:
+        # Without a possible last part, the compound can't be split
+        return [], context
+
+    context.min_final_part_len = min(final_part_lengths)
     results = split_compound_interal(
         compound,
         partial_solution=PartialSolution(parts=[], compound=compound),
@@ -236,6 +402,30 @@ def split_compound(
         first_part=True,
         context=context,
     )
+    return results, context
+
+
+def split_compound(
+    db_path,
+    lang: str,
+    compound: str,
+    ignore_word=None,
+    all_results=False,
+    write_graph_to_file: Optional[str] = None,
+    write_profile_to_file: Optional[str] = None,
+):
+    conn = connect(db_path, lang)
+    if write_profile_to_file:
+        from .profiling import Profile
+
+        profile = Profile()
+        with profile.span(compound, "word"):
+            results, context = split_compound_in_db(
+                conn, lang, compound, ignore_word, profile
+            )
+        profile.write(write_profile_to_file)
+    else:
+        results, context = split_compound_in_db(conn, lang, compound, ignore_word)
     conn.close()
 
     if write_graph_to_file:
@@ -248,10 +438,33 @@ def split_compound(
         return results[0] if results else None
 
 
-def print_query_plan(conn, query, bindings={}):
+def split_many(
+    db_path, lang: str, compounds: Iterable[str]
+) -> Iterator[tuple[str, Optional[Solution]]]:
+    """Split all `compounds`, reusing the db connection.
+
+    Yields each compound together with its best solution (or None).
+    """
+    conn = connect(db_path, lang)
+    try:
+        for compound in compounds:
+            results, _context = split_compound_in_db(conn, lang, compound)
+            yield compound, results[0] if results else None
+    finally:
+        conn.close()
+
+
+def query_plan(conn, query, bindings={}) -> list[str]:
     depth_of = {0: -1}
+    lines = []
     result = conn.execute("EXPLAIN QUERY PLAN " + query, bindings).fetchall()
     for r in result:
         depth = depth_of[r["parent"]] + 1
         depth_of[r["id"]] = depth
-        print("|  " * depth + r["detail"])
+        lines.append("|  " * depth + r["detail"])
+    return lines
+
+
+def print_query_plan(conn, query, bindings={}):
+    for line in query_plan(conn, query, bindings):
+        print(line)
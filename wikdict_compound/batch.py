@@ -0,0 +1,304 @@
+"""Split all words of a large corpus in shards.
+
+Each shard is processed by a separate process, possibly on different machines
+which share the output directory. Shards are selected either by byte range of
+the input file or by a hash of the word. Results are written to one file per
+shard, which can be resumed after an interruption, and combined by `merge`.
+The settings are stored in the output directory, so that shards created with
+different settings can't be mixed up.
+
+Usage:
+    python -m wikdict_compound.batch split LANG INPUT OUTPUT_DIR --shard I --num-shards N
+    python -m wikdict_compound.batch merge OUTPUT_DIR MERGED_FILE --num-shards N
+    python -m wikdict_compound.batch run LANG INPUT OUTPUT_DIR MERGED_FILE --num-shards N
+"""
+import argparse
+import json
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+from . import connect, normalize_word, split_compound_in_db
+
+SHARD_MODES = ["bytes", "hash"]
+
+
+def shard_path(output_dir, shard: int, num_shards: int) -> Path:
+    return Path(output_dir) / f"shard-{shard:05d}-of-{num_shards:05d}.tsv"
+
+
+def check_settings(output_dir, settings: dict) -> None:
+    """Store `settings` in `output_dir` or check that they match the stored ones"""
+    path = Path(output_dir) / "settings.json"
+    if path.exists():
+        stored = json.loads(path.read_text())
+        if stored != settings:
+            raise ValueError(
+                f"{output_dir} contains shards created with {stored}, not {settings}"
+            )
+        return
+    # Other processes might do the same, so write atomically
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(settings))
+    os.replace(tmp_path, path)
+
+
+def hash_shard(word: str, num_shards: int) -> int:
+    # Python's hash() is randomized per process, so use a stable hash instead
+    return zlib.crc32(word.encode("utf-8")) % num_shards
+
+
+def read_byte_range(input_path, start: int, end: int) -> Iterator[str]:
+    """Yield all lines starting within the byte range [start, end)"""
+    with open(input_path, "rb") as f:
+        if start > 0:
+            # Skip the line started by the previous shard
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())
+        else:
+            pos = 0
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode("utf-8")
+
+
+def read_lines(input_path) -> Iterator[str]:
+    with open(input_path, encoding="utf-8") as f:
+        yield from f
+
+
+def read_shard(
+    input_path, shard: int, num_shards: int, mode: str = "bytes"
+) -> Iterator[str]:
+    """Yield the normalized words of the given shard, without duplicates"""
+    if mode == "bytes":
+        size = os.path.getsize(input_path)
+        lines: Iterator[str] = read_byte_range(
+            input_path,
+            start=size * shard // num_shards,
+            end=size * (shard + 1) // num_shards,
+        )
+    elif mode == "hash":
+        lines = read_lines(input_path)
+    else:
+        raise ValueError(f"Unknown shard mode {mode!r}, use one of {SHARD_MODES}")
+
+    seen = set()
+    for line in lines:
+        for word in line.split():
+            word = normalize_word(word)
+            if word in seen:
+                continue
+            if mode == "hash" and hash_shard(word, num_shards) != shard:
+                continue
+            seen.add(word)
+            yield word
+
+
+def load_checkpoint(partial_path: Path) -> set[str]:
+    """Return the words already in `partial_path`.
+
+    An incomplete last line, left by an interrupted run, is removed.
+    """
+    if not partial_path.exists():
+        return set()
+    with open(partial_path, "r+b") as f:
+        content = f.read()
+        complete = content[: content.rfind(b"\n") + 1]
+        f.truncate(len(complete))
+    return {
+        line.split("\t", 1)[0] for line in complete.decode("utf-8").splitlines()
+    }
+
+
+def split_shard(
+    db_path,
+    lang: str,
+    input_path,
+    output_dir,
+    shard: int,
+    num_shards: int,
+    mode: str = "bytes",
+    checkpoint_every: int = 1000,
+) -> Path:
+    """Split all words in one shard of `input_path`.
+
+    Results are appended to a `.partial` file which is flushed every
+    `checkpoint_every` words. When the run is restarted, words found in that
+    file are skipped. The file is renamed once the shard is complete.
+    Each line contains the word followed by the parts of the best solution,
+    all separated by tabs. Words without solution are written without parts.
+    Words which fail to split are written without parts, too, and the error
+    is appended to a separate `.errors.tsv` file.
+    """
+    # Check the arguments before anything is written to `output_dir`
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"Shard {shard} is not within 0..{num_shards - 1}")
+    if not Path(input_path).is_file():
+        raise FileNotFoundError(input_path)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    conn = connect(db_path, lang)
+    try:
+        db_version = list(
+            conn.execute("SELECT make_db_md5sum, source_db_timestamp FROM version")
+            .fetchone()
+        )
+        check_settings(
+            output_dir,
+            dict(lang=lang, mode=mode, num_shards=num_shards, db_version=db_version),
+        )
+
+        path = shard_path(output_dir, shard, num_shards)
+        if path.exists():
+            return path
+        partial_path = path.with_suffix(".tsv.partial")
+        errors_path = path.with_suffix(".errors.tsv")
+
+        done = load_checkpoint(partial_path)
+        todo = (
+            word
+            for word in read_shard(input_path, shard, num_shards, mode)
+            if word not in done
+        )
+        with open(partial_path, "a", encoding="utf-8") as f:
+            for i, word in enumerate(todo, 1):
+                try:
+                    results, _context = split_compound_in_db(conn, lang, word)
+                except Exception as e:
+                    # Don't let a single word fail the whole shard again and
+                    # again on each restart
+                    with open(errors_path, "a", encoding="utf-8") as errors:
+                        errors.write(f"{word}\t{e!r}\n")
+                    results = []
+                parts = [p.written_rep for p in results[0].parts] if results else []
+                f.write("\t".join([word] + parts) + "\n")
+                if i % checkpoint_every == 0:
+                    f.flush()
+                    os.fsync(f.fileno())
+    finally:
+        conn.close()
+
+    os.replace(partial_path, path)
+    return path
+
+
+def merge(output_dir, output_path, num_shards: int) -> None:
+    """Combine the results of all shards, dropping duplicate words.
+
+    In hash mode, each word belongs to exactly one shard, so the shards are
+    simply concatenated. In bytes mode, a word can occur in several shards and
+    all words are kept in memory to drop the duplicates.
+    """
+    paths = [shard_path(output_dir, shard, num_shards) for shard in range(num_shards)]
+    missing = [str(p) for p in paths if not p.exists()]
+    if missing:
+        raise FileNotFoundError("Shards not finished: " + ", ".join(missing))
+    settings = json.loads((Path(output_dir) / "settings.json").read_text())
+    if settings["num_shards"] != num_shards:
+        raise ValueError(f"{output_dir} contains {settings['num_shards']} shards")
+
+    dedup = settings["mode"] != "hash"
+    seen = set()
+    with open(output_path, "w", encoding="utf-8") as out:
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                if not dedup:
+                    out.writelines(f)
+                    continue
+                for line in f:
+                    word = line.split("\t", 1)[0].rstrip("\n")
+                    if word in seen:
+                        continue
+                    seen.add(word)
+                    out.write(line)
+
+
+def run(
+    db_path,
+    lang: str,
+    input_path,
+    output_dir,
+    output_path,
+    num_shards: int,
+    mode: str = "bytes",
+    processes=None,
+) -> None:
+    """Split all shards in local processes and merge the results"""
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [
+            executor.submit(
+                split_shard,
+                db_path,
+                lang,
+                input_path,
+                output_dir,
+                shard,
+                num_shards,
+                mode,
+            )
+            for shard in range(num_shards)
+        ]
+        for future in futures:
+            future.result()
+    merge(output_dir, output_path, num_shards)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m wikdict_compound.batch", description=__doc__.split("\n")[0]
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    split_parser = subparsers.add_parser("split", help="split a single shard")
+    run_parser = subparsers.add_parser("run", help="split all shards and merge")
+    merge_parser = subparsers.add_parser("merge", help="merge finished shards")
+    for p in [split_parser, run_parser]:
+        p.add_argument("lang")
+        p.add_argument("input_path")
+        p.add_argument("output_dir")
+    split_parser.add_argument("--shard", type=int, required=True)
+    merge_parser.add_argument("output_dir")
+    for p in [run_parser, merge_parser]:
+        p.add_argument("output_path")
+    for p in [split_parser, run_parser, merge_parser]:
+        p.add_argument("--num-shards", type=int, required=True)
+    for p in [split_parser, run_parser]:
+        p.add_argument("--db-path", default="compound_dbs")
+        p.add_argument("--by", choices=SHARD_MODES, default="bytes")
+    run_parser.add_argument("--processes", type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == "split":
+        path = split_shard(
+            args.db_path,
+            args.lang,
+            args.input_path,
+            args.output_dir,
+            args.shard,
+            args.num_shards,
+            args.by,
+        )
+        print(f"Shard written to {path}", file=sys.stderr)
+    elif args.command == "merge":
+        merge(args.output_dir, args.output_path, args.num_shards)
+    elif args.command == "run":
+        run(
+            args.db_path,
+            args.lang,
+            args.input_path,
+            args.output_dir,
+            args.output_path,
+            args.num_shards,
+            args.by,
+            args.processes,
+        )
+
+
+if __name__ == "__main__":
+    main()
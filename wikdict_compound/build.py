@@ -1,14 +1,20 @@
 import sqlite3
 from pathlib import Path
+from functools import cache
 import hashlib
 import sys
 
+from . import normalize_word
+
 
 DEBUG_DB = False
 
 
-with open(__file__, "rb") as f:
-    md5sum = hashlib.md5(f.read()).hexdigest()
+@cache
+def get_md5sum() -> str:
+    """Hash of this file, used to detect dbs built by an older version"""
+    with open(__file__, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
 
 
 def make_db(
@@ -19,6 +25,7 @@ def make_db(
     outfile = output_path / f"{lang}-compound.sqlite3"
     infile = Path(input_path) / f"{lang}.sqlite3"
     db_timestamp = int(infile.stat().st_mtime)
+    md5sum = get_md5sum()
 
     # Skip recreation if up to date, otherwise delete existing
     if outfile.exists():
@@ -48,10 +55,6 @@ def make_db(
 
     conn = sqlite3.connect(outfile)
 
-    # sqlite's lower can only handle ascii (no Ä->ä)
-    conn.create_function("py_lower", 1, lambda x: x.lower(), deterministic=True)
-    lower = "lower" if lang != "de" else "py_lower"
-
     conn.executescript(
         rf"""
         CREATE TABLE version AS
@@ -156,6 +159,24 @@ def make_db(
             from_table="terms_from_entries",
         )
 
+    # sqlite's lower can only handle ascii (no Ä->ä), so normalize in Python.
+    # This is done once per distinct form and written_rep in bulk, which is
+    # much faster than calling a Python function for each row.
+    conn.execute(
+        f"CREATE {temp_table} normalized (original TEXT PRIMARY KEY, normalized TEXT)"
+    )
+    forms = conn.execute(
+        """
+        SELECT other_written FROM terms WHERE other_written IS NOT NULL
+        UNION
+        SELECT written_rep FROM terms WHERE written_rep IS NOT NULL
+    """
+    ).fetchall()
+    conn.executemany(
+        "INSERT INTO normalized VALUES (?, ?)",
+        ((form, normalize_word(form)) for (form,) in forms),
+    )
+
     conn.executescript(
         f"""
         CREATE {temp_view} terms_view AS
@@ -175,7 +196,7 @@ def make_db(
         FROM (
             SELECT
                 written_rep,
-                {lower}(trim(other_written, '-')) AS other_written,
+                trim(normalized, '-') AS other_written,
                 part_of_speech,
                 score_factor,
                 CASE
@@ -184,6 +205,7 @@ def make_db(
                     WHEN substr(other_written, -1, 1) = '-' THEN 'prefix'
                 END AS affix_type
             FROM terms
+                JOIN normalized ON (other_written = original)
         );
 
         CREATE {temp_view} compound_splitter_ungrouped AS
@@ -204,19 +226,27 @@ def make_db(
             );
 
         CREATE TABLE compound_splitter AS
-        SELECT 
-            other_written AS other_written,
-            affix_type,
-            group_concat(DISTINCT part_of_speech) AS part_of_speech_list,
-            max(rel_score) AS rel_score,
-            first_value(written_rep) OVER (
-                PARTITION BY other_written, affix_type
-                ORDER BY rel_score DESC
-            ) AS written_rep
-        FROM compound_splitter_ungrouped
-        GROUP BY 1, 2;
+        SELECT grouped.*, normalized AS normalized_written_rep
+        FROM (
+            SELECT
+                other_written AS other_written,
+                affix_type,
+                group_concat(DISTINCT part_of_speech) AS part_of_speech_list,
+                max(rel_score) AS rel_score,
+                first_value(written_rep) OVER (
+                    PARTITION BY other_written, affix_type
+                    ORDER BY rel_score DESC
+                ) AS written_rep
+            FROM compound_splitter_ungrouped
+            GROUP BY 1, 2
+        ) AS grouped
+            LEFT JOIN normalized ON (written_rep = original);
         
         CREATE INDEX compound_splitter_idx ON compound_splitter(other_written);
+
+        CREATE TABLE stats AS
+        SELECT max(length(other_written)) AS max_length
+        FROM compound_splitter;
     """
     )
 
@@ -0,0 +1,106 @@
+"""Opt-in profiling of the compound splitting search.
+
+A `Profile` records the search nodes, the executed SQL queries along with their
+query plans and all pruning decisions as Chrome trace events. The resulting
+JSON file can be opened in chrome://tracing, https://ui.perfetto.dev or
+https://www.speedscope.app to get a flame graph of the search.
+"""
+import heapq
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+from . import connect, query_plan, split_compound_in_db
+
+
+@dataclass
+class Profile:
+    """Trace events for one or more splits"""
+
+    events: list[dict] = field(default_factory=list)
+    query_plans: dict[str, list[str]] = field(default_factory=dict)
+    start: float = field(default_factory=time.perf_counter)
+
+    def _event(self, name: str, cat: str, ph: str, start: float, **kwargs) -> dict:
+        event = dict(
+            name=name,
+            cat=cat,
+            ph=ph,
+            ts=(start - self.start) * 1e6,
+            pid=0,
+            tid=0,
+            **kwargs,
+        )
+        self.events.append(event)
+        return event
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args) -> Iterator[dict]:
+        """Record the duration of the `with` block.
+
+        Yields the event's args, so that results can be added to them.
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            duration = (time.perf_counter() - start) * 1e6
+            self._event(name, cat, "X", start, dur=duration, args=args)
+
+    def execute(self, conn, query: str, bindings: dict) -> list:
+        """Execute and time the query, including its query plan in the trace"""
+        if query not in self.query_plans:
+            self.query_plans[query] = query_plan(conn, query, bindings)
+        plan = self.query_plans[query]
+        with self.span("query", "sql", query=query, plan=plan) as args:
+            result = conn.execute(query, bindings).fetchall()
+            args["bindings"] = bindings
+            args["rows"] = len(result)
+        return result
+
+    def prune(self, reason: str, **args) -> None:
+        self._event(
+            "prune: " + reason, "prune", "i", time.perf_counter(), s="t", args=args
+        )
+
+    def write(self, filename: str) -> None:
+        with open(filename, "w") as f:
+            json.dump(dict(traceEvents=self.events, displayTimeUnit="ms"), f)
+
+
+@dataclass(frozen=True, order=True)
+class WordTiming:
+    seconds: float
+    search_queries: int  # not counting the single query for the final part
+    compound: str
+
+
+def slowest_words(
+    db_path, lang: str, compounds: Iterable[str], count: int = 10
+) -> list[WordTiming]:
+    """Split all `compounds` and return the `count` slowest ones.
+
+    Duplicate words are only split once.
+    """
+    slowest: list[WordTiming] = []
+    seen = set()
+    conn = connect(db_path, lang)
+    try:
+        for compound in compounds:
+            if compound in seen:
+                continue
+            seen.add(compound)
+            start = time.perf_counter()
+            _results, context = split_compound_in_db(conn, lang, compound)
+            timing = WordTiming(
+                time.perf_counter() - start, context.queries, compound
+            )
+            if len(slowest) < count:
+                heapq.heappush(slowest, timing)
+            else:
+                heapq.heappushpop(slowest, timing)
+    finally:
+        conn.close()
+    return sorted(slowest, reverse=True)